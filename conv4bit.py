@@ -13,13 +13,17 @@ License: [MIT](https://opensource.org/license/mit/)
 
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import IO, cast, Callable
-import argparse
+from typing import IO, cast, Callable, Optional
 import contextlib
+import functools
 import re
 import sys
 
 
+IO_BUFSIZE = 64 * 1024
+
+HEX_DIGITS = '0123456789abcdefABCDEF'
+
 COLORS_3BIT = ['black', 'red', 'green', 'yellow', 'blue', 'magenta', 'cyan', 'white']
 
 NAME_FOR: dict[int, str] = {
@@ -41,63 +45,101 @@ NAME_FOR: dict[int, str] = {
     15: 'white_bright',
 }
 
+# Comment lines match the first alternative and are skipped by the reader.
+_STCONF_RE = re.compile(r'^//.*|(?:\[(?P<idx>\d+)\] += +)?"(?P<hex>#[0-9a-fA-F]{6})"', re.M)
+# Matches every resource line; hex is None if the value isn't a hex color.
+_XRES_RE = re.compile(r'^(?!!)([^:\n]+):(?: *(#[a-fA-F0-9]{6}))?.*', re.M)
+# One match per line: comments and blank lines match the first alternatives,
+# name-value pairs fill name and value, and anything else fills bad. The value
+# is left for Color.parse to validate.
+_NIDX_RE = re.compile(
+    r'^(?:#.*|\s*?|[ \t]*(?P<name>\S+)[ \t]+(?P<value>\S+)[ \t\r]*|(?P<bad>.+))$', re.M)
+_CSV_RE = re.compile(
+    r'^(?:#.*|\s*?|(?P<name>[^,\n]+),(?P<value>[^,\s]+)[ \t\r]*|(?P<bad>.+))$', re.M)
+
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Color:
     r: int
     g: int
     b: int
+    _hex: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, '_hex', '#' + bytes((self.r, self.g, self.b)).hex())
 
     @staticmethod
+    @functools.lru_cache(maxsize=64)
     def parse(s: str) -> 'Color':
-        if (m := re.match(r'(?:#|0x)([0-9a-fA-F]{6})', s)):
-            digits = m.group(1)
-            r = int(digits[0:2], 16)
-            g = int(digits[2:4], 16)
-            b = int(digits[4:6], 16)
-            return Color(r, g, b)
+        """ Parse '#rrggbb' or '0xrrggbb'. Results are cached and shared. """
+        if s.startswith('#'):
+            digits = s[1:7]
+        elif s.startswith('0x'):
+            digits = s[2:8]
         else:
             raise Exception(f'unexpected color format: {s}')
+        # bytes.fromhex() tolerates whitespace between bytes, so check that
+        # all 6 characters are actually hex digits.
+        if len(digits) != 6 or digits.strip(HEX_DIGITS):
+            raise Exception(f'unexpected color format: {s}')
+        r, g, b = bytes.fromhex(digits)
+        return Color(r, g, b)
 
     def hex(self) -> str:
-        return f'#{self.r:02x}{self.g:02x}{self.b:02x}'
+        return self._hex
+
+THEME_COLORS = [
+    'foreground',
+    'background',
+    *COLORS_3BIT,
+    *[f'{name}_bright' for name in COLORS_3BIT],
+    'cursor',
+    'cursor_reverse',
+]
+
+INDEX_FOR: dict[str, int] = {name: i for i, name in enumerate(THEME_COLORS)}
+
+THEME_DEFAULTS: dict[str, str] = {
+    'cursor': '#cccccc',
+    'cursor_reverse': '#555555',
+}
+
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Theme:
-    foreground: Color
-    background: Color
-
-    black: Color
-    red: Color
-    green: Color
-    yellow: Color
-    blue: Color
-    magenta: Color
-    cyan: Color
-    white: Color
-
-    black_bright: Color
-    red_bright: Color
-    green_bright: Color
-    yellow_bright: Color
-    blue_bright: Color
-    magenta_bright: Color
-    cyan_bright: Color
-    white_bright: Color
-
-    cursor: Color = field(default_factory=lambda: Color.parse('#cccccc'))
-    cursor_reverse: Color = field(default_factory=lambda: Color.parse('#555555'))
-
-
-def open_infile(filename: Path) -> IO:
-    if filename == Path('-'):
-        return cast(IO, contextlib.nullcontext(sys.stdin))
-    return open(filename)
-
-def open_outfile(filename: Path) -> IO:
-    if filename == Path('-'):
-        return cast(IO, contextlib.nullcontext(sys.stdout))
-    return open(filename, 'w')
+    """ Colors stored in THEME_COLORS order, so writers can index directly. """
+    colors: tuple[Color, ...]
+
+    @staticmethod
+    def from_dict(color_dict: dict[str, Color]) -> 'Theme':
+        for name in color_dict:
+            if name not in INDEX_FOR:
+                raise ValueError(f'unexpected color: {name}')
+        colors = []
+        for name in THEME_COLORS:
+            if name in color_dict:
+                colors.append(color_dict[name])
+            elif name in THEME_DEFAULTS:
+                colors.append(Color.parse(THEME_DEFAULTS[name]))
+            else:
+                raise ValueError(f'missing color: {name}')
+        return Theme(tuple(colors))
+
+    def __getitem__(self, name: str) -> Color:
+        return self.colors[INDEX_FOR[name]]
+
+
+def open_infile(stack: contextlib.ExitStack, filename: str) -> IO:
+    """ Open filename, or return stdin for "-". Real files are closed with stack. """
+    if filename == '-':
+        return sys.stdin
+    return stack.enter_context(open(filename, buffering=IO_BUFSIZE))
+
+def open_outfile(stack: contextlib.ExitStack, filename: str) -> IO:
+    """ Open filename, or return stdout for "-". Real files are closed with stack. """
+    if filename == '-':
+        return sys.stdout
+    return stack.enter_context(open(filename, 'w', buffering=IO_BUFSIZE))
 
 
 def read_yaml(r: IO) -> Theme:
@@ -117,7 +159,7 @@ def read_yaml_gogh(doc: dict) -> Theme:
         color_dict[f'{name}_bright'] = Color.parse(doc[f'color_{i+1+8:02d}'])
     for k in ['foreground', 'background', 'cursor']:
         color_dict[k] = Color.parse(doc[k])
-    return Theme(**color_dict)
+    return Theme.from_dict(color_dict)
 
 def read_yaml_alacritty(doc: dict) -> Theme:
     """ Read Alacritty YAML config. """
@@ -130,62 +172,54 @@ def read_yaml_alacritty(doc: dict) -> Theme:
         color_dict[name] = Color.parse(doc['colors']['normal'][name])
         color_dict[f'{name}_bright'] = Color.parse(doc['colors']['bright'][name])
 
-    return Theme(**color_dict)
+    return Theme.from_dict(color_dict)
+
 
+# Order of the colors written by the name-value pair formats (nidx, csv).
+_PAIR_KEYS = [
+    'foreground',
+    'background',
+    *[k for name in COLORS_3BIT for k in (name, f'{name}_bright')],
+    'cursor',
+    'cursor_reverse',
+]
+_PAIR_ORDER = [(k, INDEX_FOR[k]) for k in _PAIR_KEYS]
+
+
+def _read_pairs(pattern: re.Pattern, text: str) -> Theme:
+    """ Read name-value pairs using one of the line patterns above. """
+    color_dict = {}
+    for m in pattern.finditer(text):
+        if m['bad'] is not None:
+            lineno = text.count('\n', 0, m.start())
+            raise Exception(f'unexpected format on line {lineno}')
+        if m['name'] is not None:
+            color_dict[m['name']] = Color.parse(m['value'])
+    return Theme.from_dict(color_dict)
 
 def read_nidx(r: IO) -> Theme:
     """ Read whitespace-separated name-value pairs.
 
     One pair per line. Unix toolkit style.
     """
-    color_dict = {}
-    for i, line in enumerate(r):
-        if line.startswith('#'):
-            continue
-        try:
-            name, hex = line.split()
-        except ValueError:
-            raise Exception(f'unexpected format on line {i}')
-        color_dict[name] = Color.parse(hex)
-    return Theme(**color_dict)
+    return _read_pairs(_NIDX_RE, r.read())
 
 def write_nidx(w: IO, theme: Theme) -> None:
     """ Write  whitespace-separated name-value pairs. """
-    keys = ['foreground', 'background']
-    for key in COLORS_3BIT:
-        keys.append(key)
-        keys.append(f'{key}_bright')
-    keys.extend(['cursor', 'cursor_reverse'])
-
-    for k in keys:
-        c = getattr(theme, k)
-        print(f'{k} {c.hex()}', file=w)
+    colors = theme.colors
+    lines = [f'{k} {colors[i].hex()}' for k, i in _PAIR_ORDER]
+    w.write('\n'.join(lines) + '\n')
 
 
 def read_csv(r: IO) -> Theme:
     """ Read CSV-lite headerless (color_name,hex) """
-    color_dict = {}
-    for i, line in enumerate(r):
-        if line.startswith('#'):
-            continue
-        try:
-            name, hex = line.split(',')
-        except ValueError:
-            raise Exception(f'unexpected format on line {i}')
-        color_dict[name] = Color.parse(hex)
-    return Theme(**color_dict)
+    return _read_pairs(_CSV_RE, r.read())
 
 def write_csv(w: IO, theme: Theme) -> None:
     """ Write CSV-lite headerless (color_name,hex). """
-    keys = ['foreground', 'background']
-    for key in COLORS_3BIT:
-        keys.append(key)
-        keys.append(f'{key}_bright')
-    keys.extend(['cursor', 'cursor_reverse'])
-
-    for k in keys:
-        c = getattr(theme, k)
-        print(f'{k},{c.hex()}', file=w)
+    colors = theme.colors
+    lines = [f'{k},{colors[i].hex()}' for k, i in _PAIR_ORDER]
+    w.write('\n'.join(lines) + '\n')
 
 
 def read_stconf(r: IO) -> Theme:
@@ -198,88 +232,115 @@ def read_stconf(r: IO) -> Theme:
     color_for[257] = 'foreground'
 
     color_dict: dict[str, Color] = {}
-    i = 0
-    for line in r:
-        if line.startswith('//'):
+    # Entries without an explicit [index] follow on from the previous one.
+    idx = -1
+    for m in _STCONF_RE.finditer(r.read()):
+        if m['hex'] is None:
             continue
-        if m := re.search(r'(?:\[(\d+)\] += +)?"(#[0-9a-fA-F]{6}")', line):
-            num, hex = m.groups()
-            if num is not None:
-                i = int(num)
-            color = Color.parse(hex)
-            color_name = color_for[i]
-            color_dict[color_name] = color
-            i += 1
-
-        if i > 257:
+        idx = int(m['idx']) if m['idx'] else idx + 1
+        color_dict[color_for[idx]] = Color.parse(m['hex'])
+        if idx >= 257:
             break
 
-    return Theme(**color_dict)
+    return Theme.from_dict(color_dict)
+
+# (st index, name, Theme index) for each entry, in output order.
+_STCONF_ENTRIES = [
+    (i, name, INDEX_FOR[name])
+    for i, name in [*NAME_FOR.items(), (256, 'background'), (257, 'foreground')]
+]
 
 def write_stconf(w: IO, theme: Theme) -> None:
     """ Write the color config for suckless st config.h. """
-    i = 0
-    print('/* 8 normal colors */', file=w)
-    for name in COLORS_3BIT:
-        color = getattr(theme, name)
-        print(f'[{i}] = "{color.hex()}",  /* {name} */', file=w)
-        i += 1
-    print('', file=w)
+    colors = theme.colors
+
+    def entry_line(i: int, name: str, ci: int) -> str:
+        return f'[{i}] = "{colors[ci].hex()}",  /* {name} */'
 
-    print('/* 8 bright colors */', file=w)
-    for name in [f'{x}_bright' for x in COLORS_3BIT]:
-        color = getattr(theme, name)
-        print(f'[{i}] = "{color.hex()}",  /* {name} */', file=w)
-        i += 1
-    print('', file=w)
+    lines = ['/* 8 normal colors */']
+    lines.extend(entry_line(*e) for e in _STCONF_ENTRIES[:8])
+    lines.append('')
 
-    print('/* special colors */', file=w)
-    print(f'[256] = "{theme.background.hex()}",  /* background */', file=w)
-    print(f'[257] = "{theme.foreground.hex()}",  /* foreground */', file=w)
+    lines.append('/* 8 bright colors */')
+    lines.extend(entry_line(*e) for e in _STCONF_ENTRIES[8:16])
+    lines.append('')
+
+    lines.append('/* special colors */')
+    lines.extend(entry_line(*e) for e in _STCONF_ENTRIES[16:])
+    w.write('\n'.join(lines) + '\n')
 
 
 def read_xres(r: IO) -> Theme:
-    """ Read colors from Xresources. """
+    """ Read colors from Xresources.
+
+    Comments and resources other than the 4-bit palette, foreground,
+    background, and cursorColor are ignored.
+    """
     color_dict: dict[str, Color] = {}
-    for line in r:
-        if line.startswith('!') or re.search(r'^\s*$', line):
-            continue
-        if m := re.search(r'([^:]+): *(#[a-fA-F0-9]{6})', line):
-            label, hex = m.groups()
-            label = re.sub(r'.*[.*]', '', label)  # remove up to last '*' or '.'
-            color = Color.parse(hex)
-            if label in {'foreground', 'background'}:
-                color_dict[label] = color
-            elif label == 'cursorColor':
-                color_dict['cursor'] = color
-            elif label.startswith('color'):
-                num = int(label.removeprefix('color'))
-                name = NAME_FOR[num]
-                color_dict[name] = color
+    for m in _XRES_RE.finditer(r.read()):
+        label, hex = m.groups()
+        # Remove up to last '*' or '.' (rfind() gives -1 if there's neither) and
+        # any blanks before the ':'.
+        label = label[max(label.rfind('*'), label.rfind('.')) + 1:].strip()
+        if label in {'foreground', 'background'}:
+            name = label
+        elif label == 'cursorColor':
+            name = 'cursor'
+        elif label.startswith('color') and label[5:].isdecimal():
+            if (name := NAME_FOR.get(int(label[5:]))) is None:
+                continue
         else:
-            raise Exception(f'unexpected line format: {line}')
-    return Theme(**color_dict)
+            continue
+        if hex is None:
+            raise Exception(f'unexpected line format: {m[0]}')
+        color_dict[name] = Color.parse(hex)
+    return Theme.from_dict(color_dict)
+
 
+# (resource name, Theme index) for the special colors, then for each 3-bit
+# color's section.
+_XRES_SPECIAL = [
+    ('foreground', INDEX_FOR['foreground']),
+    ('background', INDEX_FOR['background']),
+    ('cursorColor', INDEX_FOR['cursor']),
+]
+_XRES_SECTIONS = [
+    (name, [(f'color{i}', INDEX_FOR[name]), (f'color{i+8}', INDEX_FOR[f'{name}_bright'])])
+    for i, name in enumerate(COLORS_3BIT)
+]
 
 def write_xres(w: IO, theme: Theme) -> None:
     """ Write colortheme in X resources format.
 
     Use the same format as https://terminal.sexy.
     """
-    def print_color(name: str, color: Color) -> None:
-        label = f'*.{name}:'
-        print(f'{label:16s}{color.hex()}', file=w)
-
-    print('! special', file=w)
-    print_color('foreground', theme.foreground)
-    print_color('background', theme.background)
-    print_color('cursorColor', theme.cursor)
+    colors = theme.colors
 
-    for i, name in enumerate(COLORS_3BIT):
-        print('', file=w)
-        print(f'! {name}', file=w)
-        print_color(f'color{i}', getattr(theme, name))
-        print_color(f'color{i+8}', getattr(theme, name + '_bright'))
+    def color_line(name: str, ci: int) -> str:
+        label = f'*.{name}:'
+        return f'{label:16s}{colors[ci].hex()}'
+
+    lines = ['! special']
+    lines.extend(color_line(*e) for e in _XRES_SPECIAL)
+
+    for name, entries in _XRES_SECTIONS:
+        lines.append('')
+        lines.append(f'! {name}')
+        lines.extend(color_line(*e) for e in entries)
+    w.write('\n'.join(lines) + '\n')
+
+_OSC_SLOTS: list[tuple[str, str]] = [
+    *[
+        slot
+        for i, name in enumerate(COLORS_3BIT)
+        for slot in ((f'4;{i}', name), (f'4;{i+8}', f'{name}_bright'))
+    ],
+    ('10', 'foreground'),
+    ('11', 'background'),
+    ('12', 'cursor'),
+]
+_OSC_TEMPLATE = ''.join(f'\033]{code};{{}}\007' for code, _ in _OSC_SLOTS)
+_OSC_INDEXES = [INDEX_FOR[name] for _, name in _OSC_SLOTS]
 
 def write_osc(w:IO, theme: Theme) -> None:
     """ Write OSC escapes to set the color palette of a running terminal.
@@ -287,77 +348,64 @@ def write_osc(w:IO, theme: Theme) -> None:
     Tested with: st, tmux, xterm
     VTE-based terminals supposedly support them, too.
     """
-    for i, name in enumerate(COLORS_3BIT):
-        c = getattr(theme, name)
-        print(f'\033]4;{i};{c.hex()}\007', file=w, end='')
-        c = getattr(theme, f'{name}_bright')
-        print(f'\033]4;{i+8};{c.hex()}\007', file=w, end='')
-    print(f'\033]10;{theme.foreground.hex()}\007', file=w, end='')
-    print(f'\033]11;{theme.background.hex()}\007', file=w, end='')
-    print(f'\033]12;{theme.cursor.hex()}\007', file=w, end='')
-
-
-IFORMATS: dict[str, Callable[[IO], Theme]] = {
-    'yaml': read_yaml,
-    'yml': read_yaml,
-    'nidx': read_nidx,
-    'stconf': read_stconf,
-    'xres': read_xres,
-    'csv': read_csv,
-}
-OFORMATS: dict[str, Callable[[IO, Theme], None]] = {
-    'stconf': write_stconf,
-    'nidx': write_nidx,
-    'xres': write_xres,
-    'csv': write_csv,
-    'osc': write_osc,
+    colors = theme.colors
+    w.write(_OSC_TEMPLATE.format(*[colors[i].hex() for i in _OSC_INDEXES]))
+
+
+Reader = Callable[[IO], Theme]
+Writer = Callable[[IO, Theme], None]
+
+# Reader and writer for each format, or None where a direction isn't supported.
+FORMATS: dict[str, tuple[Optional[Reader], Optional[Writer]]] = {
+    'yaml': (read_yaml, None),
+    'yml': (read_yaml, None),
+    'nidx': (read_nidx, write_nidx),
+    'stconf': (read_stconf, write_stconf),
+    'xres': (read_xres, write_xres),
+    'csv': (read_csv, write_csv),
+    'osc': (None, write_osc),
 }
+IFORMATS = {name: read for name, (read, _) in FORMATS.items() if read is not None}
+OFORMATS = {name: write for name, (_, write) in FORMATS.items() if write is not None}
 
 
 def main() -> None:
+    import argparse
     ap = argparse.ArgumentParser(description='''
 convert 4-bit terminal color schemes between formats
 
 Formats are guessed from filenames but can also be given with --ifmt/--ofmt.
 ''')
-    ap.add_argument('infile', default='-', type=Path, help='use "-" to read from stdin')
-    ap.add_argument('outfile', default='-', type=Path, help='use "-" to write to stdout')
+    ap.add_argument('infile', default='-', help='use "-" to read from stdin')
+    ap.add_argument('outfile', default='-', help='use "-" to write to stdout')
     ap.add_argument('--ifmt', '-i', choices=IFORMATS.keys())
     ap.add_argument('--ofmt', '-o', choices=OFORMATS.keys())
 
     args = ap.parse_args()
 
-    if args.infile == Path('-') and args.ifmt is None:
+    if args.infile == '-' and args.ifmt is None:
         print('--ifmt must be given when reading stdin', file=sys.stderr)
         sys.exit(1)
-    if args.outfile == Path('-') and args.ofmt is None:
+    if args.outfile == '-' and args.ofmt is None:
         print('--ofmt must be given when writing to stdout', file=sys.stderr)
         sys.exit(1)
 
-    ifmt = args.ifmt
-    if ifmt is None:
-        iext = args.infile.suffix.lstrip('.')
-        if iext in IFORMATS:
-            ifmt = iext
-    if ifmt is None:
+    read = IFORMATS.get(args.ifmt or Path(args.infile).suffix.lstrip('.'))
+    if read is None:
         print('unsupported input format', file=sys.stderr)
         sys.exit(1)
 
-    ofmt = args.ofmt
-    if ofmt is None:
-        oext = args.outfile.suffix.lstrip('.')
-        if oext in OFORMATS:
-            ofmt = oext
-    if ofmt is None:
+    write = OFORMATS.get(args.ofmt or Path(args.outfile).suffix.lstrip('.'))
+    if write is None:
         print('unsupported output format', file=sys.stderr)
         sys.exit(1)
 
-    with (
-        open_infile(args.infile) as infile,
-        open_outfile(args.outfile) as outfile
-    ):
-        theme = IFORMATS[ifmt](infile)
-        OFORMATS[ofmt](outfile, theme)
+    with contextlib.ExitStack() as stack:
+        infile = open_infile(stack, args.infile)
+        outfile = open_outfile(stack, args.outfile)
+        theme = read(infile)
+        write(outfile, theme)
+        outfile.flush()
 
 if __name__ == '__main__':
     main()